@@ -11,6 +11,7 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from loguru import logger
 from dotenv import load_dotenv
@@ -95,7 +96,9 @@ app = FastAPI(
     title="API Matrix etke.cc",
     description="API pour la gestion des messages via etke.cc Matrix Bridge",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Sérialisation des réponses (listes de messages) par orjson plutôt que json
+    default_response_class=ORJSONResponse
 )
 
 # Configuration CORS
@@ -342,20 +345,24 @@ async def get_messages_by_platform(platform: str, limit: int = 10):
         rooms_data = await matrix_client.get_rooms_list()
         all_rooms = rooms_data['rooms']
 
+        # Limiter à 3 rooms pour éviter la surcharge, interrogées en parallèle
+        platform_rooms = [room for room in all_rooms if room.get("platform") == platform][:3]
+        results = await asyncio.gather(
+            *(matrix_client.get_room_messages(room["room_id"], limit=5) for room in platform_rooms),
+            return_exceptions=True
+        )
+
         platform_messages = []
         rooms_checked = 0
 
-        for room in all_rooms:
-            if room.get("platform") == platform and rooms_checked < 3:  # Limiter à 3 rooms pour éviter la surcharge
-                try:
-                    room_messages = await matrix_client.get_room_messages(room["room_id"], limit=5)
-                    for msg in room_messages:
-                        msg["room_name"] = room["name"]
-                        platform_messages.append(msg)
-                    rooms_checked += 1
-                except Exception as e:
-                    logger.warning(f"Erreur pour room {room['room_id']}: {e}")
-                    continue
+        for room, room_messages in zip(platform_rooms, results):
+            if isinstance(room_messages, Exception):
+                logger.warning(f"Erreur pour room {room['room_id']}: {room_messages}")
+                continue
+            for msg in room_messages:
+                msg["room_name"] = room["name"]
+                platform_messages.append(msg)
+            rooms_checked += 1
 
         # Trier par timestamp et limiter
         platform_messages.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
@@ -416,5 +423,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         log_level="info",
-        reload=False
+        reload=False,
+        # uvloop (fourni par uvicorn[standard]) au lieu de la détection "auto"
+        loop="uvloop"
     )
\ No newline at end of file
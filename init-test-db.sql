@@ -8,6 +8,10 @@ CREATE DATABASE matrix_store_test_backup;
 GRANT ALL PRIVILEGES ON DATABASE matrix_store_test TO matrix_user;
 GRANT ALL PRIVILEGES ON DATABASE matrix_store_test_backup TO matrix_user;
 
+-- Disposable test databases: commits don't wait for the WAL flush
+ALTER DATABASE matrix_store_test SET synchronous_commit = off;
+ALTER DATABASE matrix_store_test_backup SET synchronous_commit = off;
+
 -- Connect to test database and set up initial schema
 \c matrix_store_test;
 
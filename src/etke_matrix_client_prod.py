@@ -4,6 +4,7 @@ Client Matrix Production avec PostgreSQL
 Utilise PostgreSQL pour la persistance des clés de chiffrement
 """
 import os
+import re
 import asyncio
 import base64
 from typing import Optional, Dict, List, Any
@@ -14,6 +15,7 @@ from nio import (
     AsyncClient,
     AsyncClientConfig,
     LoginResponse,
+    SyncResponse,
     RoomMessageText,
     MegolmEvent,
     MessageDirection
@@ -32,6 +34,27 @@ except ImportError:
 
 load_dotenv()
 
+# Détection des rooms bridgées par leur nom (une seule passe, sans .lower())
+INSTAGRAM_NAME_RE = re.compile(r'instagram|\(ig\)', re.IGNORECASE)
+MESSENGER_NAME_RE = re.compile(r'messenger|facebook', re.IGNORECASE)
+
+# Détection à l'initial sync sur le nom et les membres (@instagram_XXX, @whatsapp_XXX...)
+INSTAGRAM_ROOM_RE = re.compile(r'instagram', re.IGNORECASE)
+WHATSAPP_ROOM_RE = re.compile(r'whatsapp', re.IGNORECASE)
+
+# Partages de clés Megolm simultanés au démarrage (un aller-retour par room chiffrée)
+KEY_SHARE_CONCURRENCY = 8
+
+# Appels /messages simultanés par plateforme (chacun peut prendre plusieurs secondes)
+ROOM_FETCH_CONCURRENCY = 4
+
+
+def _room_info(room_name: str, room_members: List[str]) -> str:
+    """Description d'une room pour les logs (construite seulement si le log est émis)"""
+    if room_members:
+        return f"{room_name} (members: {', '.join(room_members[:3])}...)"
+    return room_name
+
 
 class ProductionMatrixClient:
     """Client Matrix production-ready avec persistance PostgreSQL"""
@@ -68,7 +91,9 @@ class ProductionMatrixClient:
             'port': int(os.getenv('POSTGRESQL_ADDON_PORT', os.getenv('POSTGRES_PORT', 5432))),
             'user': os.getenv('POSTGRESQL_ADDON_USER', os.getenv('POSTGRES_USER', 'matrix_user')),
             'password': os.getenv('POSTGRESQL_ADDON_PASSWORD', os.getenv('POSTGRES_PASSWORD')),
-            'pool_size': int(os.getenv('POSTGRES_POOL_SIZE', 20))
+            'pool_size': int(os.getenv('POSTGRES_POOL_SIZE', 20)),
+            'pool_min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 2)),
+            'external_pooler': os.getenv('POSTGRES_EXTERNAL_POOLER', 'false').lower() == 'true'
         }
 
         self.client: Optional[AsyncClient] = None
@@ -83,6 +108,8 @@ class ProductionMatrixClient:
         self.messenger_rooms: Dict[str, str] = {}
         self.message_callbacks = []
         self.sync_task = None
+        # (clé, résultat) du dernier get_rooms_list, voir _rooms_list_cache_key
+        self._rooms_list_cache = None
         self.webhook_url: Optional[str] = None
 
         logger.info(f"ProductionMatrixClient initialized (PostgreSQL: {self.use_postgres})")
@@ -168,6 +195,10 @@ class ProductionMatrixClient:
                     logger.warning(f"Could not load encryption store: {e}")
                     logger.info("💡 Continuing without persistent encryption store")
 
+                # Après load_store() : synchronous=NORMAL ne vaut que pour la
+                # connexion SQLite ouverte, seul le mode WAL est persistant
+                self._tune_sqlite_store()
+
                 # If Element session was imported, try to load those keys
                 if session_imported:
                     logger.info("🔐 Using imported Element session for encryption")
@@ -252,6 +283,19 @@ class ProductionMatrixClient:
 
         logger.info("SQLite store configured successfully")
 
+    def _tune_sqlite_store(self):
+        """Passe le store SQLite de nio en WAL (écritures des clés reçues pendant la sync)"""
+        database = getattr(getattr(self.client, 'store', None), 'database', None)
+        if database is None:
+            return
+
+        try:
+            database.execute_sql("PRAGMA journal_mode=WAL")
+            database.execute_sql("PRAGMA synchronous=NORMAL")
+            logger.debug("SQLite store switched to WAL journal")
+        except Exception as e:
+            logger.debug(f"Could not tune SQLite store: {e}")
+
     async def _load_encryption_store(self):
         """Charge le store de chiffrement (PostgreSQL ou SQLite)"""
         try:
@@ -261,7 +305,7 @@ class ProductionMatrixClient:
                 if account:
                     logger.info("🔐 Loaded Olm account from PostgreSQL")
                     # Restaurer l'account dans le client nio
-                    if hasattr(self.client, 'olm') and self.client.olm:
+                    if getattr(self.client, 'olm', None):
                         self.client.olm.account = account
 
                 # Charger les sessions Megolm
@@ -281,7 +325,7 @@ class ProductionMatrixClient:
                 logger.info("🔐 Encryption store loaded from SQLite")
 
             # Vérifier que les clés Olm sont chargées
-            if hasattr(self.client, 'olm') and self.client.olm:
+            if getattr(self.client, 'olm', None):
                 logger.info("🔑 Olm encryption keys are available")
             else:
                 logger.warning("⚠️ Olm encryption keys not loaded yet")
@@ -293,11 +337,27 @@ class ProductionMatrixClient:
         """Synchronisation initiale pour récupérer l'état"""
         logger.info("🔄 Initial sync...")
 
-        sync_response = await self.client.sync(timeout=30000, full_state=True)
+        # Reprendre depuis le dernier token connu : full_state garde l'état de
+        # toutes les rooms, mais seuls les events postérieurs au token sont renvoyés
+        since = None
+        if self.key_store and self.key_store_available:
+            try:
+                since = await self.key_store.get_sync_token(self.user_id)
+            except Exception as e:
+                logger.warning(f"Could not load sync token: {e}")
+
+        sync_response = await self.client.sync(timeout=30000, full_state=True, since=since)
+        if since and not isinstance(sync_response, SyncResponse):
+            # Token expiré ou invalide : sync complète classique
+            logger.info(f"🔄 Stored sync token rejected ({sync_response}), doing a full sync")
+            sync_response = await self.client.sync(timeout=30000, full_state=True)
 
         # Sauvegarder le token de sync
-        if self.use_postgres and self.store and sync_response.next_batch:
-            self.store.save_sync_token(sync_response.next_batch)
+        if self.key_store and self.key_store_available and getattr(sync_response, 'next_batch', None):
+            try:
+                await self.key_store.save_sync_token(self.user_id, sync_response.next_batch)
+            except Exception as e:
+                logger.warning(f"Could not save sync token: {e}")
 
         # Parser les rooms Instagram/Messenger initiales
         # Les rooms etke.cc ont des membres comme @instagram_XXX ou @whatsapp_XXX
@@ -305,23 +365,26 @@ class ProductionMatrixClient:
             room_name = room.display_name or room_id
 
             # Chercher dans les membres de la room pour identifier le type
-            room_members = list(room.users.keys()) if hasattr(room, 'users') else []
-            room_info = f"{room_name} (members: {', '.join(room_members[:3])}...)" if room_members else room_name
+            room_members = list(getattr(room, 'users', ()))
+
+            # Nom et membres réunis pour une seule recherche par plateforme
+            # (les user_ids ne contiennent pas d'espace : pas de faux positif à la jointure)
+            haystack = f"{room_name} {' '.join(room_members)}"
 
             # Détecter Instagram par les membres ou le nom
-            if any("instagram" in member.lower() for member in room_members) or "instagram" in room_name.lower():
+            if INSTAGRAM_ROOM_RE.search(haystack):
                 self.instagram_rooms[room_id] = room_name
-                logger.info(f"📷 Found Instagram room: {room_info}")
+                logger.opt(lazy=True).info("📷 Found Instagram room: {}", lambda: _room_info(room_name, room_members))
 
             # Détecter Messenger/Facebook par les membres ou le nom
-            elif any("messenger" in member.lower() or "facebook" in member.lower() for member in room_members) or "messenger" in room_name.lower() or "facebook" in room_name.lower():
+            elif MESSENGER_NAME_RE.search(haystack):
                 self.messenger_rooms[room_id] = room_name
-                logger.info(f"💬 Found Messenger room: {room_info}")
+                logger.opt(lazy=True).info("💬 Found Messenger room: {}", lambda: _room_info(room_name, room_members))
 
             # Pour WhatsApp (au cas où)
-            elif any("whatsapp" in member.lower() for member in room_members) or "whatsapp" in room_name.lower():
+            elif WHATSAPP_ROOM_RE.search(haystack):
                 # On pourrait créer une catégorie WhatsApp ou l'ignorer
-                logger.info(f"📱 Found WhatsApp room (ignored): {room_info}")
+                logger.opt(lazy=True).info("📱 Found WhatsApp room (ignored): {}", lambda: _room_info(room_name, room_members))
 
         logger.info(f"🔗 Total found: {len(self.instagram_rooms)} Instagram, {len(self.messenger_rooms)} Messenger")
 
@@ -332,22 +395,30 @@ class ProductionMatrixClient:
         # Télécharger les clés des autres devices
         await self.client.keys_query()
 
+        # Rooms chiffrées calculées une seule fois pour la restauration et le partage
+        encrypted_room_ids = [room_id for room_id, room in self.client.rooms.items() if room.encrypted]
+
         # Essayer de restaurer les clés depuis le backup du serveur
-        await self._restore_keys_from_backup()
+        await self._restore_keys_from_backup(encrypted_room_ids)
 
-        # Partager les clés pour toutes les rooms chiffrées
-        shared_count = 0
-        for room_id in self.client.rooms:
-            room = self.client.rooms[room_id]
-            if room.encrypted:
+        # Partager les clés pour toutes les rooms chiffrées, en parallèle
+        # (borné pour ne pas saturer le homeserver)
+        semaphore = asyncio.Semaphore(KEY_SHARE_CONCURRENCY)
+
+        async def share(room_id: str) -> bool:
+            async with semaphore:
                 try:
                     await self.client.share_group_session(
                         room_id,
                         ignore_unverified_devices=True
                     )
-                    shared_count += 1
+                    return True
                 except Exception as e:
                     logger.warning(f"Could not share keys for {room_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(share(room_id) for room_id in encrypted_room_ids))
+        shared_count = sum(results)
 
         logger.info(f"📊 Shared keys for {shared_count} encrypted rooms")
 
@@ -360,14 +431,14 @@ class ProductionMatrixClient:
         else:
             logger.debug("🔑 Key persistence unavailable - keys will not be saved")
 
-    async def _restore_keys_from_backup(self):
+    async def _restore_keys_from_backup(self, encrypted_room_ids: List[str]):
         """Restaurer les clés depuis le backup du serveur Matrix"""
         try:
             logger.info("🔑 Checking for key backup on server...")
 
             # D'abord essayer de restaurer depuis PostgreSQL si disponible
             if self.key_store and self.key_store_available:
-                await self._restore_keys_from_postgres()
+                await self._restore_keys_from_postgres(encrypted_room_ids)
             else:
                 logger.debug("🔑 PostgreSQL key store unavailable - cannot restore keys")
 
@@ -383,14 +454,13 @@ class ProductionMatrixClient:
 
                 # Essayer de récupérer les clés pour toutes les rooms
                 # Note: Ceci nécessite que le stockage sécurisé soit configuré
-                for room_id in self.client.rooms:
-                    if self.client.rooms[room_id].encrypted:
-                        try:
-                            # Essayer de récupérer les clés de cette room
-                            keys_response = await self.client.room_keys(room_id)
-                            logger.debug(f"Retrieved keys for room {room_id}")
-                        except Exception as room_error:
-                            logger.debug(f"No backup keys for room {room_id}: {room_error}")
+                for room_id in encrypted_room_ids:
+                    try:
+                        # Essayer de récupérer les clés de cette room
+                        keys_response = await self.client.room_keys(room_id)
+                        logger.debug(f"Retrieved keys for room {room_id}")
+                    except Exception as room_error:
+                        logger.debug(f"No backup keys for room {room_id}: {room_error}")
 
                 logger.info("✅ Key restoration attempt completed")
             else:
@@ -539,11 +609,11 @@ class ProductionMatrixClient:
                         if room:
                             room_name = room.display_name or ""
 
-                            if "instagram" in room_name.lower() or "(ig)" in room_name.lower():
+                            if INSTAGRAM_NAME_RE.search(room_name):
                                 self.instagram_rooms[room_id] = room_name
                                 logger.info(f"📷 New Instagram room: {room_name}")
 
-                            elif "messenger" in room_name.lower() or "facebook" in room_name.lower():
+                            elif MESSENGER_NAME_RE.search(room_name):
                                 self.messenger_rooms[room_id] = room_name
                                 logger.info(f"💬 New Messenger room: {room_name}")
 
@@ -552,16 +622,19 @@ class ProductionMatrixClient:
             except Exception as e:
                 logger.error(f"Error in sync callback: {e}")
 
-        # Callbacks pour les messages
+        # Callback unique pour les messages : dispatch par type exact
+        # (comparaison d'identité, pas de parcours du MRO)
         async def on_room_message(room, event):
+            event_type = type(event)
+
             # Message texte normal
-            if isinstance(event, RoomMessageText):
+            if event_type is RoomMessageText:
                 logger.info(f"📨 Plain message from {event.sender}: {event.body}")
                 for cb in self.message_callbacks:
                     await cb(room, event)
 
             # Message chiffré
-            elif isinstance(event, MegolmEvent):
+            elif event_type is MegolmEvent:
                 logger.info(f"🔐 Encrypted message from {event.sender}")
 
                 # Déchiffrer
@@ -598,7 +671,7 @@ class ProductionMatrixClient:
         # Sauvegarder l'état final en PostgreSQL si disponible
         if self.use_postgres and self.store:
             try:
-                if hasattr(self.client, 'olm') and self.client.olm:
+                if getattr(self.client, 'olm', None):
                     self.store.save_account(self.client.olm.account)
                     logger.info("💾 Saved final Olm account state to PostgreSQL")
 
@@ -634,7 +707,7 @@ class ProductionMatrixClient:
 
         try:
             # Sauvegarder l'état actuel
-            if hasattr(self.client, 'olm') and self.client.olm:
+            if getattr(self.client, 'olm', None):
                 self.store.save_account(self.client.olm.account)
 
             # Simuler un redémarrage en rechargeant
@@ -713,6 +786,19 @@ class ProductionMatrixClient:
         """Stop the Matrix client"""
         await self.close()
 
+    async def __aenter__(self):
+        """async with ProductionMatrixClient() as client: connexion à l'entrée"""
+        if not await self.start():
+            # __aexit__ n'est pas appelé si l'entrée échoue : libérer ici
+            if self.client:
+                await self.close()
+            raise RuntimeError("Could not connect ProductionMatrixClient to the Matrix server")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Ferme le client (sync, key store) en sortie, même après une erreur"""
+        await self.close()
+
     async def setup_webhook(self, webhook_url: str):
         """Setup webhook URL for external notifications"""
         self.webhook_url = webhook_url
@@ -729,15 +815,27 @@ class ProductionMatrixClient:
         else:
             return messages
 
-        for room_id in rooms.keys():
-            try:
-                room_messages = await self.get_room_messages(room_id, limit // len(rooms) if rooms else limit)
-                for msg in room_messages:
-                    msg['platform'] = platform
-                    msg['room_id'] = room_id
-                messages.extend(room_messages)
-            except Exception as e:
-                logger.error(f"Failed to get messages from {room_id}: {e}")
+        # Copie : les callbacks de sync peuvent ajouter des rooms pendant les appels
+        room_ids = list(rooms)
+        if not room_ids:
+            return messages
+        per_room_limit = limit // len(room_ids)
+        semaphore = asyncio.Semaphore(ROOM_FETCH_CONCURRENCY)
+
+        async def fetch(room_id: str) -> List[Dict]:
+            async with semaphore:
+                try:
+                    room_messages = await self.get_room_messages(room_id, per_room_limit)
+                except Exception as e:
+                    logger.error(f"Failed to get messages from {room_id}: {e}")
+                    return []
+            for msg in room_messages:
+                msg['platform'] = platform
+                msg['room_id'] = room_id
+            return room_messages
+
+        for room_messages in await asyncio.gather(*(fetch(room_id) for room_id in room_ids)):
+            messages.extend(room_messages)
 
         # Sort by timestamp and limit
         messages.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
@@ -755,11 +853,11 @@ class ProductionMatrixClient:
                 for room_id, room in self.client.rooms.items():
                     room_name = room.display_name or ""
 
-                    if "instagram" in room_name.lower() or "(ig)" in room_name.lower():
+                    if INSTAGRAM_NAME_RE.search(room_name):
                         self.instagram_rooms[room_id] = room_name
                         logger.info(f"📷 Detected Instagram room: {room_name}")
 
-                    elif "messenger" in room_name.lower() or "facebook" in room_name.lower():
+                    elif MESSENGER_NAME_RE.search(room_name):
                         self.messenger_rooms[room_id] = room_name
                         logger.info(f"💬 Detected Messenger room: {room_name}")
 
@@ -767,6 +865,11 @@ class ProductionMatrixClient:
             except Exception as e:
                 logger.error(f"Failed to sync for room detection: {e}")
 
+        # Même token de sync et mêmes rooms trackées : le résultat n'a pas changé
+        cache_key = self._rooms_list_cache_key()
+        if self._rooms_list_cache and self._rooms_list_cache[0] == cache_key:
+            return self._rooms_list_cache[1]
+
         rooms = []
 
         for room_id, room_name in self.instagram_rooms.items():
@@ -787,10 +890,20 @@ class ProductionMatrixClient:
                 'encrypted': room_obj.encrypted if room_obj else False
             })
 
-        return {
+        result = {
             'total': len(rooms),
             'rooms': rooms
         }
+        self._rooms_list_cache = (cache_key, result)
+        return result
+
+    def _rooms_list_cache_key(self):
+        """Clé du cache de get_rooms_list : token de sync + taille des rooms trackées
+
+        Les dicts de rooms ne font que grossir, leur taille suffit à détecter un ajout.
+        """
+        next_batch = self.client.next_batch if self.client else None
+        return (next_batch, len(self.instagram_rooms), len(self.messenger_rooms))
 
     async def sync_once(self):
         """Perform a single sync operation"""
@@ -815,7 +928,7 @@ class ProductionMatrixClient:
         if not self.client:
             return {'status': 'disconnected'}
 
-        olm_available = hasattr(self.client, 'olm') and self.client.olm
+        olm_available = getattr(self.client, 'olm', None) is not None
 
         # Obtenir les stats du key store si disponible
         key_store_stats = {}
@@ -867,25 +980,35 @@ class ProductionMatrixClient:
             from nio import RoomMessagesResponse, RoomMessageText, MegolmEvent, EncryptionError
             from nio.responses import RoomMessagesError
 
-            # Increase limit to get more events (Matrix returns all types of events, not just messages)
-            # We need more events because many might be encrypted and we can't decrypt them
-            actual_limit = min(limit * 10, 1000)  # Request much more to ensure we get enough readable messages
-            logger.info(f"📥 Fetching up to {actual_limit} events from room {room_id}")
-
-            response = await self.client.room_messages(
-                room_id,
-                start="",
-                limit=actual_limit,
-                direction=MessageDirection.back
-            )
+            # Matrix renvoie tous les types d'events (et des messages indéchiffrables) :
+            # on pagine via response.end jusqu'à avoir assez de messages lisibles,
+            # sans dépasser l'ancienne fenêtre de limit * 10 events
+            max_events = min(limit * 10, 1000)
+            page_size = min(max(limit * 2, 20), 100)
+            logger.info(f"📥 Fetching up to {max_events} events from room {room_id}")
+
+            # Noms résolus une fois pour la boucle par event
+            fromtimestamp = datetime.fromtimestamp
+            decrypt_event = self.client.decrypt_event
+
+            start = ""
+            fetched = 0
+            while len(messages) < limit and fetched < max_events:
+                response = await self.client.room_messages(
+                    room_id,
+                    start=start,
+                    limit=min(page_size, max_events - fetched),
+                    direction=MessageDirection.back
+                )
 
-            if isinstance(response, RoomMessagesError):
-                logger.error(f"❌ Failed to fetch messages: {response.message}")
-                return []
+                if isinstance(response, RoomMessagesError):
+                    logger.error(f"❌ Failed to fetch messages: {response.message}")
+                    break
 
-            if isinstance(response, RoomMessagesResponse) and response.chunk:
-                logger.info(f"Got {len(response.chunk)} events from room")
+                if not isinstance(response, RoomMessagesResponse) or not response.chunk:
+                    break
 
+                fetched += len(response.chunk)
                 for event in response.chunk:
                     # Stop if we have enough messages
                     if len(messages) >= limit:
@@ -900,7 +1023,7 @@ class ProductionMatrixClient:
                             'id': event.event_id,
                             'sender': event.sender,
                             'content': event.body,
-                            'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "",
+                            'timestamp': fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "",
                             'room_id': room_id,
                             'type': 'text',
                             'decrypted': True  # Plain text is considered "decrypted"
@@ -912,7 +1035,7 @@ class ProductionMatrixClient:
                         # Try to decrypt
                         try:
                             # Use the client's decrypt_event method directly
-                            decrypted = self.client.decrypt_event(event)
+                            decrypted = decrypt_event(event)
 
                             if isinstance(decrypted, RoomMessageText):
                                 decrypted_count += 1
@@ -920,7 +1043,7 @@ class ProductionMatrixClient:
                                     'id': event.event_id,
                                     'sender': event.sender,
                                     'content': decrypted.body,
-                                    'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "",
+                                    'timestamp': fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "",
                                     'room_id': room_id,
                                     'type': 'text',
                                     'decrypted': True
@@ -942,15 +1065,20 @@ class ProductionMatrixClient:
                     if message_data:
                         messages.append(message_data)
 
+                # Début de l'historique atteint
+                if not response.end or response.end == start:
+                    break
+                start = response.end
+
+            if fetched:
+                logger.info(f"Got {fetched} events from room")
                 logger.info(f"📊 Message stats - Plain: {plain_count}, Encrypted: {encrypted_count}, Decrypted: {decrypted_count}")
                 logger.info(f"✅ Returning {len(messages)} readable messages from room {room_id}")
             else:
                 logger.warning(f"No messages found in room {room_id}")
 
         except Exception as e:
-            logger.error(f"Error getting room messages: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error getting room messages: {e}")
 
         return messages
 
@@ -963,42 +1091,45 @@ class ProductionMatrixClient:
         try:
             logger.info("💾 Saving encryption keys to PostgreSQL...")
 
-            # Sauvegarder les clés du device
-            if self.user_id and self.device_id:
-                device_keys = {
-                    'ed25519': self.client.olm.account.identity_keys.get('ed25519') if hasattr(self.client, 'olm') else None,
-                    'curve25519': self.client.olm.account.identity_keys.get('curve25519') if hasattr(self.client, 'olm') else None
-                }
-                await self.key_store.save_device_keys(self.user_id, self.device_id, device_keys)
-
-            # Sauvegarder l'account Olm
-            if hasattr(self.client, 'olm') and self.client.olm:
+            # Sauvegarder l'account Olm et les clés du device (une seule requête)
+            if getattr(self.client, 'olm', None) and self.user_id:
                 account_pickle_bytes = self.client.olm.account.pickle()
                 # Convertir bytes en string pour PostgreSQL
                 account_pickle = base64.b64encode(account_pickle_bytes).decode('utf-8')
-                await self.key_store.save_olm_account(self.user_id, account_pickle)
 
-            # Sauvegarder les sessions Megolm
+                if self.device_id:
+                    identity_keys = self.client.olm.account.identity_keys
+                    device_keys = {
+                        'ed25519': identity_keys.get('ed25519'),
+                        'curve25519': identity_keys.get('curve25519')
+                    }
+                    await self.key_store.save_account_keys(
+                        self.user_id, self.device_id, device_keys, account_pickle
+                    )
+                else:
+                    # Sans device_id (NOT NULL en base), seul l'account est sauvegardé
+                    await self.key_store.save_olm_account(self.user_id, account_pickle)
+
+            # Sauvegarder les sessions Megolm (un seul envoi groupé)
             if hasattr(self.client, 'olm') and hasattr(self.client.olm, 'inbound_group_store'):
                 saved_sessions = 0
                 try:
                     # Utiliser l'attribut store directement si disponible
                     if hasattr(self.client.olm.inbound_group_store, 'store'):
                         sessions_store = self.client.olm.inbound_group_store.store
-                        for room_id, room_sessions in sessions_store.items():
-                            if isinstance(room_sessions, dict):
-                                for session_id, session_data in room_sessions.items():
-                                    try:
-                                        await self.key_store.save_megolm_session(
-                                            room_id=room_id,
-                                            session_id=session_id,
-                                            sender_key=getattr(session_data, 'sender_key', ''),
-                                            session_data=session_data,
-                                            first_known_index=getattr(session_data, 'first_known_index', 0)
-                                        )
-                                        saved_sessions += 1
-                                    except Exception as e:
-                                        logger.debug(f"Skipped session {session_id}: {e}")
+                        sessions = [
+                            {
+                                'room_id': room_id,
+                                'session_id': session_id,
+                                'sender_key': getattr(session_data, 'sender_key', ''),
+                                'session_data': session_data,
+                                'first_known_index': getattr(session_data, 'first_known_index', 0)
+                            }
+                            for room_id, room_sessions in sessions_store.items()
+                            if isinstance(room_sessions, dict)
+                            for session_id, session_data in room_sessions.items()
+                        ]
+                        saved_sessions = await self.key_store.save_megolm_sessions_bulk(sessions)
                     else:
                         logger.debug("Megolm sessions store not accessible - skipping session save")
                 except Exception as e:
@@ -1013,7 +1144,7 @@ class ProductionMatrixClient:
         except Exception as e:
             logger.error(f"Failed to save keys to PostgreSQL: {e}")
 
-    async def _restore_keys_from_postgres(self):
+    async def _restore_keys_from_postgres(self, encrypted_room_ids: List[str]):
         """Restaure les clés de chiffrement depuis PostgreSQL"""
         if not self.key_store or not self.client or not self.key_store_available:
             logger.debug("🔑 PostgreSQL key store unavailable - cannot restore keys")
@@ -1022,35 +1153,30 @@ class ProductionMatrixClient:
         try:
             logger.info("🔄 Restoring encryption keys from PostgreSQL...")
 
-            # Restaurer l'account Olm
+            # Requêtes indépendantes : lancées en parallèle sur des connexions du pool
+            reads = [
+                self.key_store.count_megolm_sessions(encrypted_room_ids),
+                self.key_store.get_stats()
+            ]
+            # L'account Olm n'est lu que si l'utilisateur est connu
             if self.user_id:
-                account_pickle = await self.key_store.get_olm_account(self.user_id)
-                if account_pickle and hasattr(self.client, 'olm'):
-                    try:
-                        # nio gère la restauration différemment
-                        logger.info("📦 Found Olm account in PostgreSQL")
-                    except Exception as e:
-                        logger.warning(f"Could not restore Olm account: {e}")
-
-            # Restaurer les sessions Megolm pour chaque room
-            restored_sessions = 0
-            for room_id in self.client.rooms:
-                if self.client.rooms[room_id].encrypted:
-                    sessions = await self.key_store.get_megolm_sessions(room_id)
-                    for session_data in sessions:
-                        try:
-                            # nio gère les sessions différemment, on les stocke pour référence
-                            restored_sessions += 1
-                        except Exception as e:
-                            logger.debug(f"Could not restore session: {e}")
+                reads.append(self.key_store.get_olm_account(self.user_id))
+            restored_sessions, stats, *account = await asyncio.gather(*reads)
+            account_pickle = account[0] if account else None
+
+            # Restaurer l'account Olm
+            if account_pickle and hasattr(self.client, 'olm'):
+                try:
+                    # nio gère la restauration différemment
+                    logger.info("📦 Found Olm account in PostgreSQL")
+                except Exception as e:
+                    logger.warning(f"Could not restore Olm account: {e}")
 
             if restored_sessions > 0:
                 logger.info(f"✅ Restored {restored_sessions} Megolm sessions from PostgreSQL")
 
             # Afficher les stats
-            stats = await self.key_store.get_stats()
             logger.info(f"📊 Available keys in PostgreSQL: {stats}")
 
         except Exception as e:
             logger.error(f"Failed to restore keys from PostgreSQL: {e}")
-
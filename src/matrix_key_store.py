@@ -3,16 +3,33 @@
 PostgreSQL Key Store pour Matrix
 Gère la persistance des clés de chiffrement E2E dans PostgreSQL
 """
-import json
 import base64
 import pickle
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 import asyncpg
+import orjson
 from loguru import logger
 from pathlib import Path
 
 
+# En dessous de ce seuil, un executemany est plus rapide que COPY + table temporaire
+MEGOLM_COPY_THRESHOLD = 50
+
+# Statistiques renvoyées quand PostgreSQL n'est pas disponible
+UNAVAILABLE_STATS = {
+    'device_keys': 0,
+    'megolm_sessions': 0,
+    'olm_sessions': 0,
+    'olm_accounts': 0,
+    'exported_keys': 0,
+    'status': 'postgresql_unavailable'
+}
+
+# Version des index secondaires (voir _create_indexes)
+INDEX_SCHEMA_VERSION = 1
+
+
 class PostgreSQLKeyStore:
     """
     Stockage persistant des clés Matrix dans PostgreSQL
@@ -25,14 +42,31 @@ class PostgreSQLKeyStore:
     async def init(self):
         """Initialise la connexion et crée les tables si nécessaire"""
         try:
-            # Extraire pool_size du config et l'utiliser pour min_size/max_size
-            pool_size = self.pg_config.pop('pool_size', 5)
-
-            self.connection_pool = await asyncpg.create_pool(
-                **self.pg_config,
-                min_size=1,
-                max_size=pool_size
-            )
+            # Copie locale : les options du pool sont retirées sans modifier
+            # self.pg_config, qui reste réutilisable pour une nouvelle init()
+            pg_config = dict(self.pg_config)
+            pool_size = pg_config.pop('pool_size', 5)
+            pool_min_size = pg_config.pop('pool_min_size', 2)
+            external_pooler = pg_config.pop('external_pooler', False)
+
+            if external_pooler:
+                # Derrière PgBouncer (pool_mode=transaction, max_prepared_statements > 0) :
+                # pas de connexions gardées au repos, le pooler s'en charge
+                self.connection_pool = await asyncpg.create_pool(
+                    **pg_config,
+                    min_size=0,
+                    max_size=pool_size,
+                    max_inactive_connection_lifetime=10
+                )
+            else:
+                # Par défaut deux connexions chaudes : les lectures indépendantes
+                # peuvent se chevaucher sans attendre l'ouverture d'une connexion.
+                # pool_min_size == pool_size ouvre tout le pool dès le démarrage.
+                self.connection_pool = await asyncpg.create_pool(
+                    **pg_config,
+                    min_size=min(pool_min_size, pool_size),
+                    max_size=pool_size
+                )
 
             await self._create_tables()
             logger.info("✅ PostgreSQL Key Store initialized")
@@ -77,12 +111,6 @@ class PostgreSQLKeyStore:
                 )
             """)
 
-            # Créer un index pour les recherches par room
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_megolm_room
-                ON matrix_megolm_sessions(room_id)
-            """)
-
             # Table pour les sessions Olm (échange de clés)
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS matrix_olm_sessions (
@@ -105,6 +133,15 @@ class PostgreSQLKeyStore:
                 )
             """)
 
+            # Table pour le token de sync (une ligne par utilisateur)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS matrix_sync_tokens (
+                    user_id TEXT PRIMARY KEY,
+                    next_batch TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+
             # Table pour les clés de rooms exportées
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS matrix_exported_keys (
@@ -121,14 +158,112 @@ class PostgreSQLKeyStore:
                 )
             """)
 
+            # Versions de schéma déjà appliquées (migrations hors transaction)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS matrix_schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+
+        await self._create_indexes()
+
+    async def _create_indexes(self):
+        """
+        Crée les index secondaires une seule fois, sans bloquer les écritures
+
+        CREATE INDEX CONCURRENTLY ne peut pas tourner dans une transaction :
+        chaque index est créé par une commande séparée, puis la version est
+        enregistrée dans matrix_schema_migrations pour ne plus y revenir.
+        """
+        async with self.connection_pool.acquire() as conn:
+            if await self._schema_version_applied(conn):
+                return
+
+            # (index créé par la commande, ou None pour un DROP ; commande)
+            statements = [
+                # Recherches par room triées par date (remplace idx_megolm_room)
+                ('idx_megolm_room_created',
+                 """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_megolm_room_created
+                    ON matrix_megolm_sessions(room_id, created_at DESC)"""),
+                (None, "DROP INDEX CONCURRENTLY IF EXISTS idx_megolm_room"),
+                # get_olm_sessions (filtre sender_key, tri par date)
+                ('idx_olm_sender_created',
+                 """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_olm_sender_created
+                    ON matrix_olm_sessions(sender_key, created_at DESC)"""),
+            ]
+
+            failed = False
+            for index_name, statement in statements:
+                try:
+                    await conn.execute(statement)
+                except Exception as e:
+                    # Par exemple un index déjà en cours de construction par une autre instance
+                    logger.warning(f"Index migration step skipped: {e}")
+                    failed = True
+                    # Un CREATE INDEX CONCURRENTLY interrompu laisse un index INVALID
+                    # que IF NOT EXISTS sauterait au prochain démarrage
+                    if index_name:
+                        await self._drop_index(conn, index_name)
+
+            # Un index INVALID d'un démarrage précédent a pu être sauté par IF NOT EXISTS
+            invalid_indexes = await conn.fetch("""
+                SELECT c.relname
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = ANY($1::text[])
+                  AND pg_table_is_visible(c.oid)
+                  AND NOT i.indisvalid
+            """, [index_name for index_name, _ in statements if index_name])
+            for row in invalid_indexes:
+                logger.warning(f"Index {row['relname']} is invalid, it will be rebuilt on next start")
+                await self._drop_index(conn, row['relname'])
+                failed = True
+
+            if not failed:
+                await conn.execute("""
+                    INSERT INTO matrix_schema_migrations (version)
+                    VALUES ($1)
+                    ON CONFLICT (version) DO NOTHING
+                """, INDEX_SCHEMA_VERSION)
+                logger.info(f"✅ Index migration v{INDEX_SCHEMA_VERSION} applied")
+
+    @staticmethod
+    async def _drop_index(conn, index_name: str):
+        """Supprime un index (sans bloquer les écritures) ; les erreurs sont seulement loggées"""
+        try:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        except Exception as e:
+            logger.warning(f"Could not drop index {index_name}: {e}")
+
+    @staticmethod
+    async def _schema_version_applied(conn) -> bool:
+        """Indique si INDEX_SCHEMA_VERSION figure dans matrix_schema_migrations"""
+        return bool(await conn.fetchval(
+            "SELECT 1 FROM matrix_schema_migrations WHERE version = $1",
+            INDEX_SCHEMA_VERSION
+        ))
+
     async def save_device_keys(self, user_id: str, device_id: str, keys: Dict[str, str]):
         """Sauvegarde les clés du device"""
+        await self.save_device_keys_bulk([(user_id, device_id, keys)])
+
+    async def save_device_keys_bulk(self, rows: List[Tuple[str, str, Dict[str, str]]]):
+        """
+        Sauvegarde les clés de plusieurs devices en un seul executemany
+
+        Args:
+            rows: Tuples (user_id, device_id, keys)
+        """
         if not self.connection_pool:
             logger.debug("PostgreSQL unavailable - skipping device keys save")
             return
 
+        if not rows:
+            return
+
         async with self.connection_pool.acquire() as conn:
-            await conn.execute("""
+            await conn.executemany("""
                 INSERT INTO matrix_device_keys (user_id, device_id, ed25519_key, curve25519_key)
                 VALUES ($1, $2, $3, $4)
                 ON CONFLICT (user_id)
@@ -137,7 +272,8 @@ class PostgreSQLKeyStore:
                     ed25519_key = $3,
                     curve25519_key = $4,
                     updated_at = NOW()
-            """, user_id, device_id, keys.get('ed25519'), keys.get('curve25519'))
+            """, [(user_id, device_id, keys.get('ed25519'), keys.get('curve25519'))
+                  for user_id, device_id, keys in rows])
 
     async def get_device_keys(self, user_id: str) -> Optional[Dict[str, str]]:
         """Récupère les clés du device"""
@@ -169,14 +305,7 @@ class PostgreSQLKeyStore:
             return
 
         try:
-            # Sérialiser la session (peut être un objet ou un dict)
-            if hasattr(session_data, 'to_json'):
-                session_json = session_data.to_json()
-            elif isinstance(session_data, dict):
-                session_json = json.dumps(session_data)
-            else:
-                # Fallback avec pickle pour les objets complexes
-                session_json = base64.b64encode(pickle.dumps(session_data)).decode('utf-8')
+            session_json = self._serialize_session_data(session_data)
 
             async with self.connection_pool.acquire() as conn:
                 await conn.execute("""
@@ -194,42 +323,109 @@ class PostgreSQLKeyStore:
         except Exception as e:
             logger.error(f"Failed to save Megolm session: {e}")
 
-    async def get_megolm_sessions(self, room_id: str) -> List[Dict[str, Any]]:
-        """Récupère toutes les sessions Megolm d'une room"""
+    async def save_megolm_sessions_bulk(self, sessions: List[Dict[str, Any]]) -> int:
+        """
+        Sauvegarde plusieurs sessions Megolm en un seul aller-retour
+
+        Au-delà de MEGOLM_COPY_THRESHOLD sessions, les lignes sont chargées par COPY
+        dans une table temporaire puis fusionnées avec un INSERT ... ON CONFLICT.
+
+        Args:
+            sessions: Dicts avec room_id, session_id, sender_key, session_data
+                      et optionnellement first_known_index
+
+        Returns:
+            Nombre de sessions envoyées à PostgreSQL
+        """
+        if not self.connection_pool:
+            logger.debug("PostgreSQL unavailable - skipping Megolm sessions bulk save")
+            return 0
+
+        records = []
+        for session in sessions:
+            try:
+                records.append((
+                    session['session_id'],
+                    session['room_id'],
+                    session['sender_key'],
+                    self._serialize_session_data(session['session_data']),
+                    session.get('first_known_index', 0)
+                ))
+            except Exception as e:
+                logger.debug(f"Skipped session {session.get('session_id')}: {e}")
+
+        if not records:
+            return 0
+
+        try:
+            async with self.connection_pool.acquire() as conn:
+                if len(records) < MEGOLM_COPY_THRESHOLD:
+                    await conn.executemany("""
+                        INSERT INTO matrix_megolm_sessions
+                        (session_id, room_id, sender_key, session_data, first_known_index)
+                        VALUES ($1, $2, $3, $4, $5)
+                        ON CONFLICT (session_id)
+                        DO UPDATE SET
+                            session_data = $4,
+                            first_known_index = LEAST(matrix_megolm_sessions.first_known_index, $5),
+                            updated_at = NOW()
+                    """, records)
+                else:
+                    async with conn.transaction():
+                        await conn.execute("""
+                            CREATE TEMP TABLE tmp_megolm_sessions
+                            (LIKE matrix_megolm_sessions INCLUDING DEFAULTS)
+                            ON COMMIT DROP
+                        """)
+                        await conn.copy_records_to_table(
+                            'tmp_megolm_sessions',
+                            records=records,
+                            columns=['session_id', 'room_id', 'sender_key',
+                                     'session_data', 'first_known_index']
+                        )
+                        # DISTINCT ON : un même session_id ne peut être mis à jour deux fois
+                        await conn.execute("""
+                            INSERT INTO matrix_megolm_sessions
+                            (session_id, room_id, sender_key, session_data, first_known_index)
+                            SELECT DISTINCT ON (session_id)
+                                session_id, room_id, sender_key, session_data, first_known_index
+                            FROM tmp_megolm_sessions
+                            ON CONFLICT (session_id)
+                            DO UPDATE SET
+                                session_data = EXCLUDED.session_data,
+                                first_known_index = LEAST(matrix_megolm_sessions.first_known_index,
+                                                          EXCLUDED.first_known_index),
+                                updated_at = NOW()
+                        """)
+
+            logger.debug(f"Saved {len(records)} Megolm sessions in bulk")
+            return len(records)
+        except Exception as e:
+            logger.error(f"Failed to bulk save Megolm sessions: {e}")
+            return 0
+
+    @staticmethod
+    def _serialize_session_data(session_data: Any) -> str:
+        """Sérialise une session (objet, dict ou objet complexe) en texte"""
+        if hasattr(session_data, 'to_json'):
+            return session_data.to_json()
+        if isinstance(session_data, dict):
+            return orjson.dumps(session_data).decode('utf-8')
+        # Fallback avec pickle pour les objets complexes
+        return base64.b64encode(pickle.dumps(session_data)).decode('utf-8')
+
+    async def count_megolm_sessions(self, room_ids: List[str]) -> int:
+        """Compte les sessions Megolm stockées pour ces rooms"""
         if not self.connection_pool:
             logger.debug("PostgreSQL unavailable - no Megolm sessions available")
-            return []
+            return 0
 
         async with self.connection_pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT session_id, sender_key, session_data, first_known_index
+            return await conn.fetchval("""
+                SELECT count(*)
                 FROM matrix_megolm_sessions
-                WHERE room_id = $1
-                ORDER BY created_at DESC
-            """, room_id)
-
-            sessions = []
-            for row in rows:
-                try:
-                    # Essayer de désérialiser
-                    session_data = row['session_data']
-                    try:
-                        # D'abord essayer JSON
-                        data = json.loads(session_data)
-                    except:
-                        # Sinon essayer pickle
-                        data = pickle.loads(base64.b64decode(session_data))
-
-                    sessions.append({
-                        'session_id': row['session_id'],
-                        'sender_key': row['sender_key'],
-                        'session_data': data,
-                        'first_known_index': row['first_known_index']
-                    })
-                except Exception as e:
-                    logger.warning(f"Failed to deserialize session: {e}")
-
-            return sessions
+                WHERE room_id = ANY($1::text[])
+            """, list(room_ids))
 
     async def save_olm_session(self, session_id: str, sender_key: str, session_pickle: str):
         """Sauvegarde une session Olm"""
@@ -261,8 +457,8 @@ class PostgreSQLKeyStore:
                 ORDER BY created_at DESC
             """, sender_key)
 
-            return [{'session_id': row['session_id'],
-                    'session_pickle': row['session_pickle']} for row in rows]
+        return [{'session_id': row['session_id'],
+                'session_pickle': row['session_pickle']} for row in rows]
 
     async def save_olm_account(self, user_id: str, account_pickle: str):
         """Sauvegarde l'account Olm"""
@@ -281,6 +477,40 @@ class PostgreSQLKeyStore:
                     updated_at = NOW()
             """, user_id, account_pickle)
 
+    async def save_account_keys(self, user_id: str, device_id: str,
+                                keys: Dict[str, str], account_pickle: str):
+        """
+        Sauvegarde l'account Olm et les clés du device en une seule requête
+
+        L'upsert de l'account alimente celui des clés via RETURNING :
+        un seul aller-retour et une seule transaction pour les deux tables.
+        """
+        if not self.connection_pool:
+            logger.debug("PostgreSQL unavailable - skipping account keys save")
+            return
+
+        async with self.connection_pool.acquire() as conn:
+            await conn.execute("""
+                WITH account AS (
+                    INSERT INTO matrix_olm_account (user_id, account_pickle, shared)
+                    VALUES ($1, $5, TRUE)
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET
+                        account_pickle = $5,
+                        shared = TRUE,
+                        updated_at = NOW()
+                    RETURNING user_id
+                )
+                INSERT INTO matrix_device_keys (user_id, device_id, ed25519_key, curve25519_key)
+                SELECT user_id, $2::text, $3::text, $4::text FROM account
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    device_id = $2,
+                    ed25519_key = $3,
+                    curve25519_key = $4,
+                    updated_at = NOW()
+            """, user_id, device_id, keys.get('ed25519'), keys.get('curve25519'), account_pickle)
+
     async def get_olm_account(self, user_id: str) -> Optional[str]:
         """Récupère l'account Olm"""
         if not self.connection_pool:
@@ -288,13 +518,40 @@ class PostgreSQLKeyStore:
             return None
 
         async with self.connection_pool.acquire() as conn:
-            row = await conn.fetchrow("""
+            return await conn.fetchval("""
                 SELECT account_pickle
                 FROM matrix_olm_account
                 WHERE user_id = $1
             """, user_id)
 
-            return row['account_pickle'] if row else None
+    async def save_sync_token(self, user_id: str, next_batch: str):
+        """Sauvegarde le token de sync"""
+        if not self.connection_pool:
+            logger.debug("PostgreSQL unavailable - skipping sync token save")
+            return
+
+        async with self.connection_pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO matrix_sync_tokens (user_id, next_batch)
+                VALUES ($1, $2)
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    next_batch = $2,
+                    updated_at = NOW()
+            """, user_id, next_batch)
+
+    async def get_sync_token(self, user_id: str) -> Optional[str]:
+        """Récupère le token de sync"""
+        if not self.connection_pool:
+            logger.debug("PostgreSQL unavailable - no sync token available")
+            return None
+
+        async with self.connection_pool.acquire() as conn:
+            return await conn.fetchval("""
+                SELECT next_batch
+                FROM matrix_sync_tokens
+                WHERE user_id = $1
+            """, user_id)
 
     async def export_room_keys(self, room_id: str) -> List[Dict[str, Any]]:
         """Exporte les clés d'une room au format Element"""
@@ -310,48 +567,90 @@ class PostgreSQLKeyStore:
                 WHERE room_id = $1
             """, room_id)
 
-            keys = []
-            for row in rows:
-                key_data = {
-                    'room_id': room_id,
-                    'session_id': row['session_id'],
-                    'session_key': row['session_key'],
-                    'algorithm': row['algorithm'],
-                    'sender_key': row['sender_key']
-                }
+        # Décodage JSON après avoir rendu la connexion au pool
+        keys = []
+        for row in rows:
+            key_data = {
+                'room_id': room_id,
+                'session_id': row['session_id'],
+                'session_key': row['session_key'],
+                'algorithm': row['algorithm'],
+                'sender_key': row['sender_key']
+            }
 
-                if row['sender_claimed_keys']:
-                    key_data['sender_claimed_keys'] = json.loads(row['sender_claimed_keys'])
-                if row['forwarding_curve25519_key_chain']:
-                    key_data['forwarding_curve25519_key_chain'] = json.loads(row['forwarding_curve25519_key_chain'])
+            if row['sender_claimed_keys']:
+                key_data['sender_claimed_keys'] = orjson.loads(row['sender_claimed_keys'])
+            if row['forwarding_curve25519_key_chain']:
+                key_data['forwarding_curve25519_key_chain'] = orjson.loads(row['forwarding_curve25519_key_chain'])
 
-                keys.append(key_data)
+            keys.append(key_data)
 
-            return keys
+        return keys
 
     async def import_room_keys(self, keys: List[Dict[str, Any]]):
-        """Importe des clés au format Element"""
+        """
+        Importe des clés au format Element
+
+        Comme save_megolm_sessions_bulk, les gros exports passent par COPY dans
+        une table temporaire ; les clés déjà présentes sont ignorées.
+        """
         if not self.connection_pool:
             logger.debug("PostgreSQL unavailable - skipping room keys import")
             return
 
+        records = [
+            (
+                key.get('room_id'),
+                key.get('session_id'),
+                key.get('session_key'),
+                key.get('algorithm', 'm.megolm.v1.aes-sha2'),
+                key.get('sender_key'),
+                self._json_or_none(key.get('sender_claimed_keys')),
+                self._json_or_none(key.get('forwarding_curve25519_key_chain'))
+            )
+            for key in keys
+        ]
+        if not records:
+            return
+
         async with self.connection_pool.acquire() as conn:
-            for key in keys:
-                await conn.execute("""
+            if len(records) < MEGOLM_COPY_THRESHOLD:
+                await conn.executemany("""
                     INSERT INTO matrix_exported_keys
                     (room_id, session_id, session_key, algorithm, sender_key,
                      sender_claimed_keys, forwarding_curve25519_key_chain)
                     VALUES ($1, $2, $3, $4, $5, $6, $7)
                     ON CONFLICT (room_id, session_id) DO NOTHING
-                """,
-                key.get('room_id'),
-                key.get('session_id'),
-                key.get('session_key'),
-                key.get('algorithm', 'm.megolm.v1.aes-sha2'),
-                key.get('sender_key'),
-                json.dumps(key.get('sender_claimed_keys')) if key.get('sender_claimed_keys') else None,
-                json.dumps(key.get('forwarding_curve25519_key_chain')) if key.get('forwarding_curve25519_key_chain') else None
+                """, records)
+                return
+
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMP TABLE tmp_exported_keys
+                    (LIKE matrix_exported_keys INCLUDING DEFAULTS)
+                    ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table(
+                    'tmp_exported_keys',
+                    records=records,
+                    columns=['room_id', 'session_id', 'session_key', 'algorithm',
+                             'sender_key', 'sender_claimed_keys',
+                             'forwarding_curve25519_key_chain']
                 )
+                await conn.execute("""
+                    INSERT INTO matrix_exported_keys
+                    (room_id, session_id, session_key, algorithm, sender_key,
+                     sender_claimed_keys, forwarding_curve25519_key_chain)
+                    SELECT room_id, session_id, session_key, algorithm, sender_key,
+                           sender_claimed_keys, forwarding_curve25519_key_chain
+                    FROM tmp_exported_keys
+                    ON CONFLICT (room_id, session_id) DO NOTHING
+                """)
+
+    @staticmethod
+    def _json_or_none(value: Any) -> Optional[str]:
+        """Encode en JSON, ou NULL pour une valeur vide (liste/dict vide, None)"""
+        return orjson.dumps(value).decode('utf-8') if value else None
 
     async def clear_all_keys(self):
         """Efface toutes les clés (DANGER!)"""
@@ -360,32 +659,35 @@ class PostgreSQLKeyStore:
             return
 
         async with self.connection_pool.acquire() as conn:
-            await conn.execute("TRUNCATE matrix_device_keys, matrix_megolm_sessions, matrix_olm_sessions, matrix_olm_account, matrix_exported_keys")
+            # Le token de sync part avec les clés : reprendre une sync incrémentale
+            # sans clés ferait manquer les room keys des messages déjà vus
+            await conn.execute("""
+                TRUNCATE matrix_device_keys, matrix_megolm_sessions, matrix_olm_sessions,
+                         matrix_olm_account, matrix_exported_keys, matrix_sync_tokens
+                RESTART IDENTITY
+            """)
             logger.warning("⚠️ All encryption keys have been cleared!")
 
     async def get_stats(self) -> Dict[str, int]:
         """Statistiques sur les clés stockées"""
         if not self.connection_pool:
-            return {
-                'device_keys': 0,
-                'megolm_sessions': 0,
-                'olm_sessions': 0,
-                'olm_accounts': 0,
-                'exported_keys': 0,
-                'status': 'postgresql_unavailable'
-            }
+            return dict(UNAVAILABLE_STATS)
 
+        # Un seul aller-retour ; la requête est préparée une fois par connexion
+        # grâce au cache de statements d'asyncpg
         async with self.connection_pool.acquire() as conn:
-            stats = {}
-
-            stats['device_keys'] = await conn.fetchval("SELECT COUNT(*) FROM matrix_device_keys")
-            stats['megolm_sessions'] = await conn.fetchval("SELECT COUNT(*) FROM matrix_megolm_sessions")
-            stats['olm_sessions'] = await conn.fetchval("SELECT COUNT(*) FROM matrix_olm_sessions")
-            stats['olm_accounts'] = await conn.fetchval("SELECT COUNT(*) FROM matrix_olm_account")
-            stats['exported_keys'] = await conn.fetchval("SELECT COUNT(*) FROM matrix_exported_keys")
-            stats['status'] = 'postgresql_connected'
+            row = await conn.fetchrow("""
+                SELECT
+                    (SELECT COUNT(*) FROM matrix_device_keys) AS device_keys,
+                    (SELECT COUNT(*) FROM matrix_megolm_sessions) AS megolm_sessions,
+                    (SELECT COUNT(*) FROM matrix_olm_sessions) AS olm_sessions,
+                    (SELECT COUNT(*) FROM matrix_olm_account) AS olm_accounts,
+                    (SELECT COUNT(*) FROM matrix_exported_keys) AS exported_keys
+            """)
 
-            return stats
+        stats = dict(row)
+        stats['status'] = 'postgresql_connected'
+        return stats
 
     async def close(self):
         """Ferme le pool de connexions"""
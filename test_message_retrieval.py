@@ -3,25 +3,29 @@
 Test script to properly retrieve and decrypt messages from encrypted Matrix rooms
 """
 import os
+import sys
 import asyncio
 import json
-from datetime import datetime
 from pathlib import Path
+from typing import NamedTuple, Optional
 from dotenv import load_dotenv
-from nio import (
-    AsyncClient,
-    AsyncClientConfig,
-    LoginResponse,
-    RoomMessageText,
-    MegolmEvent,
-    RoomEncryptedMedia,
-    MessageDirection,
-    EncryptionError
-)
 from loguru import logger
 
 load_dotenv()
 
+# Per-event log lines are only emitted with --verbose (the summary always is)
+VERBOSE = "--verbose" in sys.argv
+
+
+class Msg(NamedTuple):
+    """A retrieved message (tuple-backed: no per-instance dict, works on Python 3.8)"""
+    type: str
+    sender: str
+    content: str
+    timestamp: int
+    session_id: Optional[str] = None
+
+
 async def test_message_retrieval():
     """Test retrieving messages from encrypted rooms"""
 
@@ -29,6 +33,20 @@ async def test_message_retrieval():
     homeserver = os.getenv("ETKE_HOMESERVER", "https://matrix.chalky.etke.host")
     username = os.getenv("ETKE_USERNAME", "@florent:chalky.etke.host")
     password = os.getenv("ETKE_PASSWORD")
+    if not password:
+        logger.error("❌ ETKE_PASSWORD not set")
+        return
+
+    # nio (and libolm) is only imported once the configuration is usable
+    from nio import (
+        AsyncClient,
+        AsyncClientConfig,
+        LoginResponse,
+        RoomMessageText,
+        MegolmEvent,
+        MessageDirection,
+        EncryptionError
+    )
 
     # Create store path for encryption keys
     store_path = Path("./test_store")
@@ -58,13 +76,24 @@ async def test_message_retrieval():
         if isinstance(response, LoginResponse):
             logger.success(f"✅ Logged in successfully")
 
-            # Do a full sync to get encryption keys
-            logger.info("🔄 Performing full sync to get encryption keys...")
-            sync_response = await client.sync(timeout=30000, full_state=True)
-            logger.info(f"✅ Sync completed, next batch: {sync_response.next_batch[:20]}...")
-
             # Test room: Flo Chalky Instagram
             room_id = "!GHTWDcxXouPfkhMVqy:chalky.etke.host"
+
+            # Sync only the test room with lazy-loaded members: room keys still
+            # arrive as to-device events, which room filters do not affect
+            sync_filter = {
+                "room": {
+                    "rooms": [room_id],
+                    "state": {"lazy_load_members": True},
+                    "timeline": {"limit": 10}
+                },
+                "presence": {"not_types": ["*"]},
+                "account_data": {"not_types": ["*"]}
+            }
+            logger.info("🔄 Performing filtered sync to get encryption keys...")
+            sync_response = await client.sync(timeout=30000, sync_filter=sync_filter)
+            logger.info(f"✅ Sync completed, next batch: {sync_response.next_batch[:20]}...")
+
             logger.info(f"📥 Fetching messages from room {room_id}")
 
             # Get messages with higher limit to include older history
@@ -75,94 +104,110 @@ async def test_message_retrieval():
                 direction=MessageDirection.back  # Go backwards in time
             )
 
+            # Timestamps stay raw (ms since epoch): the summary below never prints them
             messages = []
-            encrypted_count = 0
-            decrypted_count = 0
-            plain_count = 0
+            counts = {'plain': 0, 'encrypted': 0, 'decrypted': 0}
+
+            def handle_plain(event):
+                counts['plain'] += 1
+                messages.append(Msg(
+                    type='plain',
+                    sender=event.sender,
+                    content=event.body,
+                    timestamp=event.server_timestamp
+                ))
+                if VERBOSE:
+                    logger.info(f"📝 Plain message from {event.sender[:20]}...")
+
+            def handle_megolm(event):
+                counts['encrypted'] += 1
+
+                # Try to decrypt
+                try:
+                    decrypted = client.decrypt_event(event)
+
+                    if isinstance(decrypted, EncryptionError):
+                        logger.warning(f"⚠️ Failed to decrypt: {decrypted}")
+                        messages.append(Msg(
+                            type='encrypted_failed',
+                            sender=event.sender,
+                            content=f"[Encrypted - {decrypted}]",
+                            timestamp=event.server_timestamp,
+                            session_id=event.session_id
+                        ))
+                    elif isinstance(decrypted, RoomMessageText):
+                        counts['decrypted'] += 1
+                        messages.append(Msg(
+                            type='decrypted',
+                            sender=event.sender,
+                            content=decrypted.body,
+                            timestamp=event.server_timestamp
+                        ))
+                        if VERBOSE:
+                            logger.success(f"🔓 Decrypted message from {event.sender[:20]}...")
+                    else:
+                        logger.warning(f"❓ Unknown decrypted type: {type(decrypted)}")
+
+                except Exception as e:
+                    logger.error(f"❌ Decryption error: {e}")
+                    messages.append(Msg(
+                        type='encrypted_error',
+                        sender=event.sender,
+                        content=f"[Encrypted - Error: {str(e)}]",
+                        timestamp=event.server_timestamp
+                    ))
+
+            # One dict lookup per event instead of an isinstance chain;
+            # other event types (state, receipts...) are skipped
+            handlers = {
+                RoomMessageText: handle_plain,
+                MegolmEvent: handle_megolm
+            }
 
             if hasattr(messages_response, 'chunk'):
                 logger.info(f"📊 Got {len(messages_response.chunk)} events from room")
 
                 for event in messages_response.chunk:
-                    # Handle plain text messages
-                    if isinstance(event, RoomMessageText):
-                        plain_count += 1
-                        messages.append({
-                            'type': 'plain',
-                            'sender': event.sender,
-                            'content': event.body,
-                            'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "unknown"
-                        })
-                        logger.info(f"📝 Plain message from {event.sender[:20]}...")
-
-                    # Handle encrypted messages
-                    elif isinstance(event, MegolmEvent):
-                        encrypted_count += 1
-
-                        # Try to decrypt
-                        try:
-                            decrypted = client.decrypt_event(event)
-
-                            if isinstance(decrypted, EncryptionError):
-                                logger.warning(f"⚠️ Failed to decrypt: {decrypted}")
-                                messages.append({
-                                    'type': 'encrypted_failed',
-                                    'sender': event.sender,
-                                    'content': f"[Encrypted - {decrypted}]",
-                                    'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "unknown",
-                                    'session_id': event.session_id
-                                })
-                            elif isinstance(decrypted, RoomMessageText):
-                                decrypted_count += 1
-                                messages.append({
-                                    'type': 'decrypted',
-                                    'sender': event.sender,
-                                    'content': decrypted.body,
-                                    'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "unknown"
-                                })
-                                logger.success(f"🔓 Decrypted message from {event.sender[:20]}...")
-                            else:
-                                logger.warning(f"❓ Unknown decrypted type: {type(decrypted)}")
-
-                        except Exception as e:
-                            logger.error(f"❌ Decryption error: {e}")
-                            messages.append({
-                                'type': 'encrypted_error',
-                                'sender': event.sender,
-                                'content': f"[Encrypted - Error: {str(e)}]",
-                                'timestamp': datetime.fromtimestamp(event.server_timestamp / 1000).isoformat() if event.server_timestamp else "unknown"
-                            })
+                    handler = handlers.get(type(event))
+                    if handler:
+                        handler(event)
 
             # Print summary
             logger.info(f"""
 📊 Message Statistics:
 - Total events: {len(messages_response.chunk) if hasattr(messages_response, 'chunk') else 0}
-- Plain messages: {plain_count}
-- Encrypted messages: {encrypted_count}
-- Successfully decrypted: {decrypted_count}
-- Failed to decrypt: {encrypted_count - decrypted_count}
+- Plain messages: {counts['plain']}
+- Encrypted messages: {counts['encrypted']}
+- Successfully decrypted: {counts['decrypted']}
+- Failed to decrypt: {counts['encrypted'] - counts['decrypted']}
 """)
 
-            # Print recent messages
-            logger.info("\n📨 Recent Messages (newest first):")
-            for i, msg in enumerate(messages[:20]):  # Show first 20 messages
-                sender_short = msg['sender'].split(':')[0] if ':' in msg['sender'] else msg['sender']
-
-                if msg['type'] == 'plain':
-                    logger.info(f"{i+1}. [PLAIN] {sender_short}: {msg['content'][:100]}...")
-                elif msg['type'] == 'decrypted':
-                    logger.success(f"{i+1}. [DECRYPTED] {sender_short}: {msg['content'][:100]}...")
-                elif msg['type'] == 'encrypted_failed':
-                    logger.warning(f"{i+1}. [ENCRYPTED] {sender_short}: Failed to decrypt (session: {msg.get('session_id', 'unknown')[:8]}...)")
-                else:
-                    logger.error(f"{i+1}. [ERROR] {sender_short}: {msg['content'][:100]}...")
+            # Print recent messages: one log record, only built if INFO is enabled
+            def format_recent_messages():
+                lines = ["\n📨 Recent Messages (newest first):"]
+                for i, msg in enumerate(messages[:20], 1):  # Show first 20 messages
+                    sender_short = msg.sender.split(':')[0]
+
+                    if msg.type == 'plain':
+                        lines.append(f"{i}. [PLAIN] {sender_short}: {msg.content[:100]}...")
+                    elif msg.type == 'decrypted':
+                        lines.append(f"{i}. [DECRYPTED] {sender_short}: {msg.content[:100]}...")
+                    elif msg.type == 'encrypted_failed':
+                        lines.append(f"{i}. [ENCRYPTED] {sender_short}: Failed to decrypt (session: {(msg.session_id or 'unknown')[:8]}...)")
+                    else:
+                        lines.append(f"{i}. [ERROR] {sender_short}: {msg.content[:100]}...")
+                return "\n".join(lines)
+
+            logger.opt(lazy=True).info("{}", format_recent_messages)
 
             # Check if we have encryption keys
-            if hasattr(client, 'olm') and client.olm:
+            # getattr with a default: one lookup per attribute, no hasattr + re-read
+            olm = getattr(client, 'olm', None)
+            if olm:
                 logger.info("✅ Olm encryption is available")
 
                 # Check if we have the account
-                if hasattr(client.olm, 'account') and client.olm.account:
+                if getattr(olm, 'account', None):
                     logger.info("✅ Olm account is loaded")
                 else:
                     logger.warning("⚠️ No Olm account loaded")
@@ -173,13 +218,17 @@ async def test_message_retrieval():
             logger.error(f"❌ Login failed: {response}")
 
     except Exception as e:
-        logger.error(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error: {e}")
 
     finally:
         await client.close()
         logger.info("🔌 Client closed")
 
 if __name__ == "__main__":
+    # uvloop ships with uvicorn[standard]; fall back to the default loop without it
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(test_message_retrieval())
\ No newline at end of file
@@ -3,68 +3,229 @@
 Serveur de test simple pour recevoir et afficher les webhooks
 """
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, Response
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
+from logging.handlers import QueueListener
+from loguru import logger
+import asyncio
+import logging
+import orjson
+import os
+import queue
+import sys
 import uvicorn
-import json
 
-app = FastAPI(title="Webhook Test Server")
+# Détail de chaque webhook en DEBUG (par défaut) ; WEBHOOK_LOG_LEVEL=INFO ne garde
+# qu'une ligne par lot, sans formater le détail.
+# enqueue=True : loguru écrit depuis son propre thread, pas depuis la boucle
+logger.remove()
+logger.add(sink=sys.stdout, level=os.getenv("WEBHOOK_LOG_LEVEL", "DEBUG").upper(), enqueue=True)
 
-# Stockage des webhooks reçus
-received_webhooks = []
+# Logs uvicorn (error + access) : la boucle dépose les records dans une file,
+# un QueueListener (thread dédié) fait les écritures sur stderr
+uvicorn_log_queue = queue.Queue()
+uvicorn_stream_handler = logging.StreamHandler()
+uvicorn_stream_handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+uvicorn_log_listener = QueueListener(uvicorn_log_queue, uvicorn_stream_handler)
+
+UVICORN_LOG_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "queue": {"class": "logging.handlers.QueueHandler", "queue": uvicorn_log_queue}
+    },
+    "loggers": {
+        "uvicorn": {"handlers": ["queue"], "level": "INFO", "propagate": False},
+        "uvicorn.error": {"level": "INFO"},
+        "uvicorn.access": {"handlers": ["queue"], "level": "INFO", "propagate": False}
+    }
+}
+
+# Le drainer vide la file toutes les DRAIN_INTERVAL secondes ou tous les DRAIN_BATCH_SIZE webhooks
+DRAIN_INTERVAL = 1.0
+DRAIN_BATCH_SIZE = 100
+
+# File entre les handlers et le drainer, créée au démarrage dans lifespan
+webhook_queue: asyncio.Queue = None
+
+# Seuls headers conservés avec chaque webhook
+KEPT_HEADERS = ("content-type", "x-hub-signature-256", "user-agent")
+
+# Taille max d'un body de webhook (au-delà : 413 sans lire le body)
+MAX_WEBHOOK_BODY_SIZE = 64_000
+
+
+async def drain_webhooks():
+    """Stocke et affiche les webhooks reçus, par lots, hors du chemin des requêtes"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch.append(await webhook_queue.get())
+            # Le délai court depuis le premier webhook du lot, pas depuis le dernier
+            deadline = loop.time() + DRAIN_INTERVAL
+            while len(batch) < DRAIN_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(webhook_queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            store_webhooks(batch)
+            # loguru (enqueue=True) écrit déjà depuis son thread : un simple callback
+            # suffit, sans le Future ni le passage par l'executor
+            loop.call_soon(log_webhooks, batch)
+            batch = []
+    except asyncio.CancelledError:
+        # Arrêt du serveur : le lot en cours et la file sont stockés avant de sortir
+        while not webhook_queue.empty():
+            batch.append(webhook_queue.get_nowait())
+        if batch:
+            store_webhooks(batch)
+            log_webhooks(batch)
+        raise
+
+
+def store_webhooks(batch):
+    """Ajoute un lot de webhooks à l'historique"""
+    global total_received
+    received_webhooks.extend(batch)
+    total_received += len(batch)
+    invalidate_response_cache()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarre le drainer de webhooks et l'arrête à la fermeture"""
+    global webhook_queue
+    webhook_queue = asyncio.Queue()
+    drainer = asyncio.create_task(drain_webhooks())
+    yield
+    drainer.cancel()
+    try:
+        await drainer
+    except asyncio.CancelledError:
+        pass
+
+
+app = FastAPI(title="Webhook Test Server", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Stockage des webhooks reçus (borné : les plus anciens sont écartés)
+MAX_STORED_WEBHOOKS = 10000
+received_webhooks = deque(maxlen=MAX_STORED_WEBHOOKS)
+# Nombre de webhooks reçus depuis le démarrage ou le dernier /clear (non borné)
+total_received = 0
+
+# Réponses /history et /count déjà encodées, valables jusqu'au prochain changement de l'historique
+_history_cache: Optional[bytes] = None
+_count_cache: Optional[bytes] = None
+
+
+def invalidate_response_cache():
+    """À appeler après toute modification de received_webhooks"""
+    global _history_cache, _count_cache
+    _history_cache = None
+    _count_cache = None
 
 @app.post("/webhooks/instagram")
 async def receive_instagram_webhook(request: Request):
     """Recevoir les webhooks Instagram"""
     try:
-        # Récupérer le body JSON
-        body = await request.json()
+        if int(request.headers.get("content-length", 0)) > MAX_WEBHOOK_BODY_SIZE:
+            return ORJSONResponse({"error": "payload too large"}, status_code=413)
 
-        # Ajouter timestamp de réception
+        # Récupérer le body JSON (orjson plutôt que le json de la stdlib)
+        raw_body = await request.body()
+        # Body envoyé sans content-length (chunked)
+        if len(raw_body) > MAX_WEBHOOK_BODY_SIZE:
+            return ORJSONResponse({"error": "payload too large"}, status_code=413)
+        body = orjson.loads(raw_body)
+
+        # Ajouter timestamp de réception (datetime sérialisé nativement par orjson)
         webhook_data = {
-            "received_at": datetime.now().isoformat(),
-            "headers": dict(request.headers),
+            "received_at": datetime.now(),
+            "headers": {k: request.headers[k] for k in KEPT_HEADERS if k in request.headers},
             "body": body
         }
 
-        received_webhooks.append(webhook_data)
-
-        # Afficher dans la console
-        print(f"\n🔔 WEBHOOK REÇU à {webhook_data['received_at']}")
-        print(f"📱 Platform: {body.get('platform', 'unknown')}")
-        print(f"👤 Sender: {body.get('sender', 'unknown')}")
-        print(f"💬 Message: {body.get('message', 'no message')}")
-        print(f"🏠 Room: {body.get('room_name', 'unknown')}")
-        print(f"📄 Full data: {json.dumps(body, indent=2)}")
-        print("-" * 50)
+        # Stockage et affichage faits par le drainer
+        webhook_queue.put_nowait(webhook_data)
 
         return {"status": "received", "timestamp": webhook_data['received_at']}
 
+    except ValueError as e:
+        # content-length non numérique ou body JSON invalide (orjson.JSONDecodeError)
+        logger.warning(f"⚠️ Webhook invalide: {e}")
+        return ORJSONResponse({"error": str(e)}, status_code=400)
+
     except Exception as e:
-        print(f"❌ Erreur webhook: {e}")
-        return {"error": str(e)}, 500
+        logger.error(f"❌ Erreur webhook: {e}")
+        return ORJSONResponse({"error": str(e)}, status_code=500)
+
+def log_webhooks(batch):
+    """Logger un lot de webhooks reçus : une ligne INFO, le détail en DEBUG"""
+    logger.info("🔔 {} webhook(s) reçu(s)", len(batch))
+    for webhook_data in batch:
+        # lazy : describe_webhook n'est appelé que si DEBUG est actif
+        logger.opt(lazy=True).debug("🔔 {}", lambda: describe_webhook(webhook_data))
+
+def describe_webhook(webhook_data):
+    """Résumé d'un webhook sur une ligne (le body peut être n'importe quel JSON)"""
+    body = webhook_data['body']
+    if not isinstance(body, dict):
+        return f"{webhook_data['received_at']} | 📄 {body!r}"
+    return (
+        f"{webhook_data['received_at']}"
+        f" | 📱 {body.get('platform', 'unknown')}"
+        f" | 👤 {body.get('sender', 'unknown')}"
+        f" | 🏠 {body.get('room_name', 'unknown')}"
+        f" | 💬 {body.get('message', 'no message')}"
+    )
 
 @app.get("/webhooks/history")
 async def get_webhook_history():
-    """Voir l'historique des webhooks reçus"""
-    return {
-        "total": len(received_webhooks),
-        "webhooks": received_webhooks[-10:]  # Derniers 10
-    }
+    """Voir l'historique des webhooks reçus
+
+    Un webhook n'apparaît qu'après le passage du drainer, soit jusqu'à
+    DRAIN_INTERVAL secondes après le POST.
+    """
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = orjson.dumps({
+            "total": total_received,
+            # Derniers 10 : accès par la fin du deque, sans copier tout l'historique
+            "webhooks": [received_webhooks[i] for i in range(-min(10, len(received_webhooks)), 0)]
+        })
+    return Response(content=_history_cache, media_type="application/json")
 
 @app.get("/webhooks/count")
 async def get_webhook_count():
-    """Compter les webhooks reçus"""
-    return {
-        "total_received": len(received_webhooks),
-        "last_received": received_webhooks[-1]["received_at"] if received_webhooks else None
-    }
+    """Compter les webhooks reçus (même délai que /webhooks/history)"""
+    global _count_cache
+    if _count_cache is None:
+        _count_cache = orjson.dumps({
+            "total_received": total_received,
+            "last_received": received_webhooks[-1]["received_at"] if received_webhooks else None
+        })
+    return Response(content=_count_cache, media_type="application/json")
 
 @app.delete("/webhooks/clear")
 async def clear_webhook_history():
     """Vider l'historique"""
-    global received_webhooks
-    count = len(received_webhooks)
-    received_webhooks = []
+    global total_received
+    count = total_received
+    # Jeter aussi les webhooks encore en file, sinon le drainer les réinsère après le clear
+    while webhook_queue is not None and not webhook_queue.empty():
+        webhook_queue.get_nowait()
+        count += 1
+    received_webhooks.clear()
+    total_received = 0
+    invalidate_response_cache()
     return {"cleared": count}
 
 if __name__ == "__main__":
@@ -72,4 +233,14 @@ if __name__ == "__main__":
     print("📡 URL de test: http://localhost:8001/webhooks/instagram")
     print("📊 Historique: http://localhost:8001/webhooks/history")
     print("🔢 Compteur: http://localhost:8001/webhooks/count")
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+    uvicorn_log_listener.start()
+    try:
+        # uvloop + httptools (fournis par uvicorn[standard]) au lieu de la détection "auto"
+        uvicorn.run(
+            app, host="0.0.0.0", port=8001, log_level="info", loop="uvloop", http="httptools",
+            log_config=UVICORN_LOG_CONFIG,
+            # Backpressure : au-delà, uvicorn répond 503 plutôt que d'empiler les requêtes
+            limit_concurrency=1000, backlog=2048, timeout_keep_alive=5
+        )
+    finally:
+        uvicorn_log_listener.stop()
\ No newline at end of file